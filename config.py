@@ -1,32 +1,50 @@
+import copy
+import functools
 import json
 import os
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Collection, Dict, Optional
+
+# 安装了orjson时用它解析JSON，否则使用标准库
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+
+@functools.lru_cache(maxsize=8)
+def _load_config_data(config_path: str, mtime_ns: int) -> Dict[str, Any]:
+    """读取并解析配置文件，按路径和修改时间缓存，文件修改后自动重新读取"""
+    return _json_loads(Path(config_path).read_bytes())
 
 
 @dataclass
 class Config:
     """配置数据类"""
     monitor_path: str
-    media_exts: List[str]
+    media_exts: Collection[str]
     recursive: bool = True
+    initial_scan: bool = False
     log_level: str = "INFO"
     log_file: str = "media_monitor.log"
     ai_enabled: bool = False
     ai_api_key: str = ""
     ai_endpoint: str = ""
     ai_model: str = "gpt-4o"
+    ai_cache_file: str = ""
 
     @classmethod
     def from_file(cls, config_path: str = 'config.json') -> 'Config':
         """从配置文件加载配置"""
-        if not os.path.exists(config_path):
+        try:
+            mtime_ns = os.stat(config_path).st_mtime_ns
+        except FileNotFoundError:
             raise FileNotFoundError(f"配置文件不存在: {config_path}")
 
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config_data = json.load(f)
-
+        # 缓存的数据是共享的，复制一份再构造配置，避免validate等修改影响缓存
+        config_data = copy.deepcopy(_load_config_data(config_path, mtime_ns))
         return cls(**config_data)
 
     def validate(self) -> None:
@@ -40,4 +58,10 @@ class Config:
             raise ValueError("AI功能已启用但缺少API密钥或端点URL")
 
         # 确保路径是绝对路径
-        self.monitor_path = os.path.abspath(self.monitor_path)
\ No newline at end of file
+        self.monitor_path = os.path.abspath(self.monitor_path)
+
+        # 扩展名统一为小写并带点号，转为集合便于快速查找
+        self.media_exts = frozenset(
+            ext.lower() if ext.startswith('.') else '.' + ext.lower()
+            for ext in self.media_exts
+        )
\ No newline at end of file
@@ -1,52 +1,119 @@
+import atexit
 import logging
 import os
-from logging.handlers import RotatingFileHandler
-from typing import Optional
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional, Tuple
 
 from config import Config
 
 
+class BufferedRotatingFileHandler(RotatingFileHandler):
+    """带写缓冲的滚动文件处理器，定时或遇到错误级别日志时才刷新到磁盘"""
+
+    def __init__(self, filename: str, maxBytes: int = 0, backupCount: int = 0, encoding: Optional[str] = None,
+                 buffer_size: int = 64 * 1024, flush_interval: float = 30.0):
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._size = 0
+        super().__init__(filename, maxBytes=maxBytes, backupCount=backupCount, encoding=encoding)
+
+        # 后台定时刷新，避免空闲时日志长时间停留在缓冲区
+        self._stop_flush = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically)
+        self._flusher.daemon = True
+        self._flusher.start()
+
+    def _open(self):
+        """以大缓冲区打开日志文件，并记录当前文件大小"""
+        stream = open(self.baseFilename, self.mode, buffering=self.buffer_size,
+                      encoding=self.encoding, errors=self.errors)
+        self._size = os.fstat(stream.fileno()).st_size
+        return stream
+
+    def _flush_periodically(self) -> None:
+        """定时刷新缓冲区"""
+        while not self._stop_flush.wait(self.flush_interval):
+            self.flush()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """写入日志记录，按已写入字节数判断是否滚动，不再每条都seek和flush"""
+        try:
+            msg = self.format(record) + self.terminator
+            size = len(msg.encode(self.encoding or 'utf-8', errors='replace'))
+
+            if self.stream is None:
+                self.stream = self._open()
+            if self.maxBytes > 0 and self._size + size >= self.maxBytes:
+                self.doRollover()
+
+            self.stream.write(msg)
+            self._size += size
+
+            if record.levelno >= logging.ERROR:
+                self.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def close(self) -> None:
+        """停止定时刷新并关闭文件，可重复调用"""
+        self._stop_flush.set()
+        super().close()
+
+
 class Logger:
     """日志管理类"""
     _instance: Optional['Logger'] = None
 
-    def __new__(cls, config: Optional[Config] = None):
-        """单例模式实现"""
+    def __new__(cls, config: Optional[Config] = None, truncate: bool = False):
+        """单例模式实现，truncate为True时删除已有的日志文件"""
         if cls._instance is None:
             cls._instance = super(Logger, cls).__new__(cls)
-            cls._instance._setup(config)
-        elif config:
-            cls._instance._setup(config)
-        return cls._instance
+            cls._instance._listener = None
+            cls._instance._configured = False
+            cls._instance._settings = None
+            atexit.register(cls._instance._shutdown)
+
+        # 已配置且设置未变化时直接复用，避免重复关闭和打开日志文件
+        instance = cls._instance
+        if not instance._configured or truncate or (config and instance._settings != cls._settings_of(config)):
+            instance._setup(config, truncate)
+        return instance
 
-    def _setup(self, config: Optional[Config] = None) -> None:
+    @staticmethod
+    def _settings_of(config: Optional[Config]) -> Tuple[str, str]:
+        """获取配置中与日志相关的设置（日志级别, 日志文件）"""
+        if config:
+            return config.log_level, config.log_file
+        return "INFO", "media_monitor.log"
+
+    def _setup(self, config: Optional[Config] = None, truncate: bool = False) -> None:
         """设置日志记录器"""
         self.logger = logging.getLogger('media_monitor')
 
         # 清除所有现有处理器
+        self._shutdown()
         for handler in self.logger.handlers[:]:
             self.logger.removeHandler(handler)
 
         # 设置日志级别
-        log_level = "INFO"
-        log_file = "media_monitor.log"
+        log_level, log_file = self._settings_of(config)
 
-        if config:
-            log_level = config.log_level
-            log_file = config.log_file
-
-        # 如果日志文件存在，直接删除它
-        if os.path.exists(log_file):
+        # 需要时删除已有的日志文件
+        if truncate:
             try:
                 os.remove(log_file)
-            except:
+            except OSError:
                 pass
 
         level = getattr(logging, log_level)
         self.logger.setLevel(level)
 
         # 创建文件处理器
-        file_handler = RotatingFileHandler(
+        file_handler = BufferedRotatingFileHandler(
             log_file,
             maxBytes=10 * 1024 * 1024,
             backupCount=5,
@@ -63,9 +130,26 @@ class Logger:
         file_handler.setFormatter(formatter)
         console_handler.setFormatter(formatter)
 
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(console_handler)
+        # 日志记录只入队，由后台线程写入文件和控制台
+        log_queue = queue.Queue(-1)
+        self.logger.addHandler(QueueHandler(log_queue))
+        self._listener = QueueListener(log_queue, file_handler, console_handler)
+        self._listener.start()
+
+        self._settings = (log_level, log_file)
+        self._configured = True
+
+    def _shutdown(self) -> None:
+        """停止后台写日志线程，写完队列中剩余的记录并关闭处理器"""
+        listener = self._listener
+        if listener is None:
+            return
+
+        self._listener = None
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
 
     def get_logger(self):
         """获取日志记录器实例"""
-        return self.logger
\ No newline at end of file
+        return self.logger
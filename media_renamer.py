@@ -1,15 +1,209 @@
+import atexit
+import ctypes
+import errno
+import functools
 import json
 import os
 import re
+import sys
+import threading
 import time
 import traceback
-from dataclasses import dataclass
+from dataclasses import astuple, dataclass
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Any
 
-from config import Config
+from config import Config, _json_loads
 from logger import Logger
 
+# 预编译的正则表达式
+_YEAR_RE = re.compile(r'(19|20)\d{2}')
+_SEASON_RE = re.compile(r'[Ss](\d{1,2})|第(\d{1,2})季')
+_SEASON_PREFIX_RE = re.compile(r'[Ss](\d{1,2})')
+# 集数的各种写法合并为一个正则：E01 / 第01集 / [01] / name.01.mp4
+_EP_ALL_RE = re.compile(
+    r'[Ee](?P<std>\d{1,2})'
+    r'|第(?P<cn>\d{1,2})集'
+    r'|[\[\(（](?P<bracket>\d{1,2})[\]\)）]'
+    r'|(?<!\d)(?P<tail>\d{2})(?=\.\w+$)'
+)
+_RES_RE = re.compile(r'(1080[pP]|720[pP]|4[kK]|2160[pP]|UHD)')
+# 标题后的清晰度/片源/编码等尾部信息，只匹配标记本身（前面的分隔符由rstrip清理），
+# 不在标记前加可变长度前缀，避免长分隔符串上的回溯
+_TAIL_JUNK_RE = re.compile(r'(?:1080[pP]|720[pP]|4[kK]|BluRay|WEB-DL|HDR|x26[45]|H\.?26[45]).*$')
+# 标题中的季集标记（S01E01 / S01 / E01 / 第1季 / 第1集），标题在此截断
+_TITLE_MARKER_RE = re.compile(
+    r'(?<![A-Za-z0-9])(?:[Ss]\d{1,2}(?:[Ee]\d{1,2})?|[Ee]\d{1,2})(?!\d)'
+    r'|第\d{1,2}[季集]'
+)
+# 本工具输出的标准名称（及不带方括号的分辨率写法），已是此格式的名称不再处理
+_TARGET_NAME_RE = re.compile(
+    r'^.+（(?:(?:19|20)\d{2}|未知)）'
+    r'(?:\s*-\s*(?:S\d{2,}E\d{2,}|Season \d{2,}))?'
+    r'(?:\s*-\s*\[?(?:1080[pP]|720[pP]|4[kK]|2160[pP]|UHD)\]?)?'
+    r'(?:\.\w+)?$'
+)
+_JSON_FENCE_RE = re.compile(r'```json\s*|\s*```')
+_SUGGESTION_CLEAN_RE = re.compile(r'```.*\n|\n```|^[\s`"\']*|[\s`"\']*$')
+
+# 左括号，标题以其结尾说明截取不完整
+_OPEN_BRACKETS = frozenset('([{<（【《')
+# 标题首尾需要清理的分隔符（空白字符另由str.strip处理，覆盖所有Unicode空白）
+_TRIM_CHARS = ' \t\n\r\f\v\u3000.-_[](){}<>《》【】（）'
+
+
+# Linux上使用renameat2(RENAME_NOREPLACE)，一次系统调用完成"目标不存在才重命名"
+_AT_FDCWD = -100
+_RENAME_NOREPLACE = 1
+_renameat2 = None
+if sys.platform.startswith('linux'):
+    try:
+        _renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+        _renameat2.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+        _renameat2.restype = ctypes.c_int
+    except (OSError, AttributeError):
+        _renameat2 = None
+
+
+def _rename_noreplace(src: str, dst: str) -> bool:
+    """重命名但不覆盖已存在的目标，目标已存在时返回False，其他错误抛出OSError"""
+    if _renameat2 is not None:
+        if _renameat2(_AT_FDCWD, os.fsencode(src), _AT_FDCWD, os.fsencode(dst), _RENAME_NOREPLACE) == 0:
+            return True
+        err = ctypes.get_errno()
+        if err == errno.EEXIST:
+            return False
+        # 文件系统或内核不支持该标志时回退到普通方式
+        if err not in (errno.EINVAL, errno.ENOSYS):
+            raise OSError(err, os.strerror(err), src, None, dst)
+
+    if os.path.exists(dst):
+        return False
+    os.rename(src, dst)
+    return True
+
+
+# 单次AI请求的超时时间（秒），避免停止时长时间等待未完成的请求
+_AI_REQUEST_TIMEOUT = 60.0
+
+# AI缓存有新结果后延迟写入文件的时间（秒），期间的结果合并为一次写入
+_AI_CACHE_SAVE_DELAY = 30.0
+
+# 重命名目录失败后每次重试前的退避时间（秒）
+_RENAME_RETRY_DELAYS = (0.1, 0.25, 0.6)
+
+
+class RetryLaterError(Exception):
+    """操作暂时无法完成（如目录仍在写入），需要稍后重试"""
+
+
+def _rstrip_title(text: str) -> str:
+    """去掉标题末尾的空白和分隔符"""
+    while True:
+        stripped = text.rstrip().rstrip(_TRIM_CHARS)
+        if stripped == text:
+            return text
+        text = stripped
+
+
+def _lstrip_title(text: str) -> str:
+    """去掉标题开头的空白和分隔符"""
+    while True:
+        stripped = text.lstrip().lstrip(_TRIM_CHARS)
+        if stripped == text:
+            return text
+        text = stripped
+
+
+@functools.lru_cache(maxsize=32)
+def _season_episode_re(season_str: str) -> 're.Pattern':
+    """获取季数后跟集数（如S01.01）的正则表达式"""
+    return re.compile(rf'[Ss]{season_str}[\. _-](\d{{1,2}})')
+
+
+def _extract_episode_number(name: str) -> Optional[int]:
+    """从文件名提取集数"""
+    # 单次扫描，按优先级记录各写法的首个匹配
+    found: Dict[str, str] = {}
+    for match in _EP_ALL_RE.finditer(name):
+        group = match.lastgroup
+        if group not in found:
+            found[group] = match.group(group)
+        # 1. 标准格式 E01 / 第01集，优先级最高
+        if group in ('std', 'cn'):
+            return int(found[group])
+
+    # 2. 方括号等包围的数字 [01]
+    if 'bracket' in found:
+        return int(found['bracket'])
+
+    # 3. 季数后跟集数 S01.01
+    season_match = _SEASON_PREFIX_RE.search(name)
+    if season_match:
+        season_str = season_match.group(1)
+        episode_match = _season_episode_re(season_str).search(name)
+        if episode_match:
+            return int(episode_match.group(1))
+
+    # 4. 文件名末尾的数字 name.01.mp4
+    if 'tail' in found:
+        return int(found['tail'])
+
+    return None
+
+
+@functools.lru_cache(maxsize=4096)
+def _extract_media_info_cached(name: str) -> Optional[Tuple[str, str, str, Optional[int], Optional[int], Optional[str]]]:
+    """从名称中提取媒体信息（纯函数，按名称缓存结果）"""
+    # 自动提取年份
+    year_match = _YEAR_RE.search(name)
+    year = year_match.group(0) if year_match else None
+
+    # 尝试找出标题
+    if year and year_match:
+        year_pos = year_match.start()
+
+        # 年份前面的部分可能是标题
+        if year_pos > 0:
+            title = _rstrip_title(name[:year_pos]).lstrip()
+        else:
+            # 年份在开头，则后面的内容可能是标题
+            title = _lstrip_title(name[4:]).rstrip()
+    else:
+        # 没有年份，整个名称可能是标题（清理常见后缀）
+        title = _rstrip_title(_TAIL_JUNK_RE.sub('', name, count=1)).lstrip()
+
+    # 季集标记之后的内容不属于标题
+    marker_match = _TITLE_MARKER_RE.search(title)
+    if marker_match and marker_match.start() > 0:
+        title = _rstrip_title(title[:marker_match.start()])
+
+    # 检测季集信息
+    season_match = _SEASON_RE.search(name)
+    season_num = int(season_match.group(1) or season_match.group(2)) if season_match else 1
+
+    episode_num = _extract_episode_number(name)
+
+    # 清晰度匹配
+    resolution_match = _RES_RE.search(name)
+    resolution = resolution_match.group(1) if resolution_match else None
+
+    # 确定媒体类型
+    media_type = "tv" if (season_match or episode_num) else "movie"
+
+    # 返回不可变元组，由调用方构造MediaInfo
+    if title and (year or media_type == "tv"):
+        return (
+            title,
+            year or "未知",
+            media_type,
+            season_num if media_type == "tv" else None,
+            episode_num,
+            resolution,
+        )
+
+    return None
+
 
 @dataclass
 class MediaInfo:
@@ -29,6 +223,48 @@ class MediaInfo:
     def is_tv(self) -> bool:
         return self.type == "tv"
 
+    @property
+    def is_complete(self) -> bool:
+        """信息是否足够完整（有干净的标题和年份，电视剧还需有集数）"""
+        if len(self.title) <= 1 or self.year == "未知":
+            return False
+        # 标题以未闭合的括号结尾或仍含季集标记，说明正则截取有误，交给AI处理
+        if self.title[-1] in _OPEN_BRACKETS or _TITLE_MARKER_RE.search(self.title):
+            return False
+        return not self.is_tv or self.episode is not None
+
+
+def _resolution_tag(media_info: MediaInfo) -> str:
+    """文件名中的分辨率标记"""
+    return f" - [{media_info.resolution}]" if media_info.resolution else ""
+
+
+def _format_movie(media_info: MediaInfo, ext: str) -> str:
+    """电影：标题（年份） - [分辨率].扩展名"""
+    return f"{media_info.title}（{media_info.year}）{_resolution_tag(media_info)}{ext}"
+
+
+def _format_episode(media_info: MediaInfo, ext: str) -> str:
+    """电视剧单集：标题（年份） - S01E01 - [分辨率].扩展名"""
+    season_num = str(media_info.season or 1).zfill(2)
+    episode_num = str(media_info.episode).zfill(2)
+    return f"{media_info.title}（{media_info.year}） - S{season_num}E{episode_num}{_resolution_tag(media_info)}{ext}"
+
+
+def _format_season(media_info: MediaInfo, ext: str) -> str:
+    """电视剧整季：标题（年份） - Season 01 - [分辨率].扩展名"""
+    season_num = str(media_info.season or 1).zfill(2)
+    return f"{media_info.title}（{media_info.year}） - Season {season_num}{_resolution_tag(media_info)}{ext}"
+
+
+# 按（是否电影, 是否有集数）选择文件名格式
+_FILENAME_FORMATTERS = {
+    (True, False): _format_movie,
+    (True, True): _format_movie,
+    (False, True): _format_episode,
+    (False, False): _format_season,
+}
+
 
 class MediaRenamer:
     """媒体文件重命名工具"""
@@ -38,22 +274,122 @@ class MediaRenamer:
         self.config = config
         self.logger = Logger(config).get_logger()
 
-        # 导入AI库
+        # AI请求结果缓存，相同输入不再重复请求
+        self._ai_client = None
+        self._ai_cache: Dict[str, Any] = {}
+        self._ai_cache_lock = threading.Lock()
+        self._ai_cache_dirty = False
+        self._ai_cache_timer: Optional[threading.Timer] = None
+        self._ai_cache_save_lock = threading.Lock()
+        # 批量请求时每个提示最多包含的文件名数量
+        self._ai_batch_max = 16
+
+        # 创建AI客户端，所有请求共用同一个客户端及其连接池
         if self.config.ai_enabled:
+            # AI库为可选依赖，只在启用AI时导入，避免拖慢未启用AI时的启动
             try:
-                import openai
-                self.logger.info("AI命名功能已启用")
+                from openai import OpenAI
             except ImportError:
                 self.logger.error("缺少OpenAI库，AI功能已禁用")
                 self.config.ai_enabled = False
+            else:
+                self._ai_client = OpenAI(
+                    base_url=self.config.ai_endpoint,
+                    api_key=self.config.ai_api_key,
+                    timeout=_AI_REQUEST_TIMEOUT,
+                )
+                self.logger.info("AI命名功能已启用")
+                self._load_ai_cache()
+                if self.config.ai_cache_file:
+                    atexit.register(self.save_ai_cache)
 
-    def process_directory(self, directory_path: str) -> Optional[str]:
-        """处理目录"""
-        if not os.path.exists(directory_path):
-            self.logger.error(f"目录不存在: {directory_path}")
-            return None
+    def _load_ai_cache(self) -> None:
+        """从缓存文件加载AI结果"""
+        cache_file = self.config.ai_cache_file
+        if not cache_file or not os.path.exists(cache_file):
+            return
+
+        try:
+            data = _json_loads(Path(cache_file).read_bytes())
+            if not isinstance(data, dict):
+                raise ValueError("缓存文件内容不是JSON对象")
+        except Exception as e:
+            self.logger.error(f"加载AI缓存失败: {e}")
+            return
+
+        # 手动编辑或损坏的条目直接丢弃，避免使用时出错
+        entries = {key: value for key, value in data.items() if self._is_valid_ai_cache_entry(key, value)}
+        if len(entries) < len(data):
+            self.logger.warning(f"已忽略无效的AI缓存条目: {len(data) - len(entries)} 条")
+        self._ai_cache.update(entries)
+        self.logger.debug(f"已加载AI缓存: {len(self._ai_cache)} 条")
+
+    @staticmethod
+    def _is_valid_ai_cache_entry(key: str, value: Any) -> bool:
+        """检查缓存条目的值是否与键的类型相符（info为字典，name为字符串）"""
+        try:
+            kind = json.loads(key)[1]
+        except (ValueError, TypeError, IndexError, KeyError):
+            return False
+        if kind == 'info':
+            return isinstance(value, dict)
+        if kind == 'name':
+            return isinstance(value, str)
+        return False
+
+    def _ai_cache_key(self, *parts: Any) -> str:
+        """生成AI缓存键，包含模型名以免切换模型后命中旧结果"""
+        return json.dumps([self.config.ai_model, *parts], ensure_ascii=False)
+
+    def _ai_cache_update(self, entries: Dict[str, Any]) -> None:
+        """写入AI缓存，配置了缓存文件时延迟批量持久化"""
+        with self._ai_cache_lock:
+            self._ai_cache.update(entries)
+            if not self.config.ai_cache_file:
+                return
+
+            self._ai_cache_dirty = True
+            if self._ai_cache_timer is None:
+                self._ai_cache_timer = threading.Timer(_AI_CACHE_SAVE_DELAY, self.save_ai_cache)
+                self._ai_cache_timer.daemon = True
+                self._ai_cache_timer.start()
+
+    def save_ai_cache(self) -> None:
+        """将有变化的AI缓存写入文件，退出时也会自动调用"""
+        cache_file = self.config.ai_cache_file
+        if not cache_file:
+            return
+
+        # 同一时间只允许一个写入，持有缓存锁的时间只用于复制数据
+        with self._ai_cache_save_lock:
+            with self._ai_cache_lock:
+                if self._ai_cache_timer is not None:
+                    self._ai_cache_timer.cancel()
+                    self._ai_cache_timer = None
+                if not self._ai_cache_dirty:
+                    return
+                self._ai_cache_dirty = False
+                snapshot = dict(self._ai_cache)
 
-        dir_name = os.path.basename(directory_path)
+            try:
+                tmp_file = f"{cache_file}.tmp"
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f, ensure_ascii=False)
+                os.replace(tmp_file, cache_file)
+            except Exception as e:
+                self.logger.error(f"保存AI缓存失败: {e}")
+
+    def process_directory(self, directory_path: str, entry: Optional[os.DirEntry] = None) -> Optional[str]:
+        """处理目录，entry为scandir得到的目录项时可省去重复的stat调用"""
+        if entry is not None:
+            dir_name = entry.name
+        else:
+            try:
+                os.stat(directory_path, follow_symlinks=False)
+            except OSError:
+                self.logger.error(f"目录不存在: {directory_path}")
+                return None
+            dir_name = os.path.basename(directory_path)
 
         # 排除特定目录名称
         excluded_dirs = ["电影", "电视剧", "动漫", "综艺", "纪录片", "Movies", "TV", "Anime", "Shows"]
@@ -61,6 +397,11 @@ class MediaRenamer:
             self.logger.info(f"跳过特定目录: {dir_name}")
             return directory_path
 
+        # 已是标准格式的目录不再处理，避免重复重命名
+        if _TARGET_NAME_RE.match(dir_name):
+            self.logger.debug(f"已是标准格式，跳过目录: {dir_name}")
+            return directory_path
+
         # 从目录名推断媒体信息
         media_info = self.extract_media_info(dir_name)
 
@@ -70,18 +411,28 @@ class MediaRenamer:
 
         return directory_path
 
-    def process_file(self, file_path: str, directory: str) -> Optional[str]:
-        """处理单个文件"""
-        if not os.path.exists(file_path):
-            self.logger.error(f"文件不存在: {file_path}")
-            return None
+    def process_file(self, file_path: str, directory: str, entry: Optional[os.DirEntry] = None) -> Optional[str]:
+        """处理单个文件，entry为scandir得到的目录项时可省去重复的stat调用"""
+        if entry is not None:
+            filename = entry.name
+        else:
+            try:
+                os.stat(file_path, follow_symlinks=False)
+            except OSError:
+                self.logger.error(f"文件不存在: {file_path}")
+                return None
+            filename = os.path.basename(file_path)
 
         # 跳过非媒体文件
-        filename = os.path.basename(file_path)
         _, ext = os.path.splitext(filename)
         if ext.lower() not in self.config.media_exts:
             return None
 
+        # 已是标准格式的文件不再处理，避免重复重命名
+        if _TARGET_NAME_RE.match(filename):
+            self.logger.debug(f"已是标准格式，跳过文件: {filename}")
+            return file_path
+
         # 从文件名推断媒体信息
         media_info = self.extract_media_info(filename)
 
@@ -101,106 +452,46 @@ class MediaRenamer:
 
         # 如果媒体信息有效，重命名文件
         if media_info:
-            return self.rename_file(file_path, media_info)
+            return self.rename_file(file_path, media_info, directory, filename)
 
         return file_path
 
     def extract_media_info(self, name: str) -> Optional[MediaInfo]:
         """从名称中提取媒体信息"""
-        # 如果启用了AI，优先使用AI提取
+        # 先用正则解析，结果完整时无需请求AI
+        media_info = self.extract_media_info_local(name)
+        if media_info and media_info.is_complete:
+            return media_info
+
+        # 正则结果不完整时，如果启用了AI，再使用AI提取
         if self.config.ai_enabled:
             ai_info = self.ai_extract_media_info(name)
             if ai_info:
                 return ai_info
 
-        # 自动提取年份
-        year_match = re.search(r'(19|20)\d{2}', name)
-        year = year_match.group(0) if year_match else None
-
-        # 尝试找出标题
-        if year and year_match:
-            year_pos = year_match.start()
-
-            # 年份前面的部分可能是标题
-            if year_pos > 0:
-                title = name[:year_pos].strip()
-                title = re.sub(r'[\s\.\-_\[\]\(\)\{\}\<\>《》【】]*$', '', title)
-            else:
-                # 年份在开头，则后面的内容可能是标题
-                title = re.sub(r'^\d{4}[\s\.\-_\[\]\(\)\{\}\<\>《》【】]*', '', name).strip()
-        else:
-            # 没有年份，整个名称可能是标题（清理常见后缀）
-            title = re.sub(r'(1080[pP]|720[pP]|4[kK]|BluRay|WEB-DL).*$', '', name).strip()
-            title = re.sub(r'[\s\.\-_\[\]\(\)\{\}\<\>《》【】]*$', '', title)
-
-        # 检测季集信息
-        season_match = re.search(r'[Ss](\d{1,2})|第(\d{1,2})季', name)
-        season_num = int(season_match.group(1) or season_match.group(2)) if season_match else 1
-
-        episode_num = self.extract_episode_number(name)
-
-        # 清晰度匹配
-        resolution_match = re.search(r'(1080[pP]|720[pP]|4[kK]|2160[pP]|UHD)', name)
-        resolution = resolution_match.group(1) if resolution_match else None
-
-        # 确定媒体类型
-        media_type = "tv" if (season_match or episode_num) else "movie"
-
-        # 创建媒体信息对象
-        if title and (year or media_type == "tv"):
-            return MediaInfo(
-                title=title,
-                year=year or "未知",
-                type=media_type,
-                season=season_num if media_type == "tv" else None,
-                episode=episode_num,
-                resolution=resolution
-            )
+        return media_info
 
-        return None
+    def extract_media_info_local(self, name: str) -> Optional[MediaInfo]:
+        """仅使用正则从名称中提取媒体信息"""
+        # 正则解析结果按名称缓存，每次返回新的MediaInfo以免调用方修改缓存
+        info = _extract_media_info_cached(name)
+        return MediaInfo(*info) if info else None
 
     def extract_episode_number(self, name: str) -> Optional[int]:
         """从文件名提取集数"""
-        # 1. 标准格式 E01
-        episode_match = re.search(r'[Ee](\d{1,2})|第(\d{1,2})集', name)
-
-        # 2. 方括号等包围的数字 [01]
-        if not episode_match:
-            episode_match = re.search(r'[\[\(（](\d{1,2})[\]\)）]', name)
-
-        # 3. 季数后跟集数 S01.01
-        if not episode_match:
-            season_match = re.search(r'[Ss](\d{1,2})', name)
-            if season_match:
-                season_str = season_match.group(1)
-                episode_match = re.search(r'[Ss]' + season_str + r'[\. _-](\d{1,2})', name)
-
-        # 4. 文件名末尾的数字 name.01.mp4
-        if not episode_match:
-            episode_match = re.search(r'(?<!\d)(\d{2})(?=\.\w+$)', name)
-
-        if episode_match:
-            try:
-                return int(episode_match.group(1) or episode_match.group(2))
-            except:
-                pass
-
-        return None
+        return _extract_episode_number(name)
 
     def ai_extract_media_info(self, name: str) -> Optional[MediaInfo]:
         """使用AI从名称中提取媒体信息"""
         if not self.config.ai_enabled:
             return None
 
-        try:
-            from openai import OpenAI
-
-            # 初始化OpenAI客户端
-            client = OpenAI(
-                base_url=self.config.ai_endpoint,
-                api_key=self.config.ai_api_key,
-            )
+        cache_key = self._ai_cache_key('info', name)
+        cached = self._ai_cache.get(cache_key)
+        if cached is not None:
+            return self._media_info_from_ai(cached)
 
+        try:
             # 准备提示
             prompt = f"""
             从以下文件名/目录名中提取媒体信息："{name}"
@@ -227,7 +518,7 @@ class MediaRenamer:
             """
 
             # 发送请求
-            response = client.chat.completions.create(
+            response = self._ai_client.chat.completions.create(
                 messages=[
                     {
                         "role": "system",
@@ -252,22 +543,17 @@ class MediaRenamer:
             content = message.content.strip()
 
             # 处理可能的Markdown代码块
-            content = re.sub(r'```json\s*|\s*```', '', content)
+            content = _JSON_FENCE_RE.sub('', content)
 
             try:
                 # 解析JSON
-                ai_info = json.loads(content)
+                ai_info = _json_loads(content)
                 self.logger.info(f"AI提取的媒体信息: {ai_info}")
 
                 # 转换为MediaInfo对象
-                return MediaInfo(
-                    title=ai_info.get('title', ''),
-                    year=str(ai_info.get('year', '未知')),
-                    type=ai_info.get('type', 'unknown'),
-                    season=ai_info.get('season'),
-                    episode=ai_info.get('episode'),
-                    resolution=ai_info.get('resolution')
-                )
+                media_info = self._media_info_from_ai(ai_info)
+                self._ai_cache_update({cache_key: ai_info})
+                return media_info
             except json.JSONDecodeError:
                 self.logger.error(f"无法解析AI返回的JSON: {content}")
             except Exception as e:
@@ -279,9 +565,120 @@ class MediaRenamer:
 
         return None
 
+    def ai_extract_media_info_batch(self, names: List[str]) -> Dict[str, MediaInfo]:
+        """使用AI批量提取媒体信息，一次请求处理多个名称，结果写入缓存"""
+        results: Dict[str, MediaInfo] = {}
+        if not self.config.ai_enabled:
+            return results
+
+        # 已缓存的名称无需再请求
+        pending = []
+        for name in dict.fromkeys(names):
+            cached = self._ai_cache.get(self._ai_cache_key('info', name))
+            if cached is not None:
+                results[name] = self._media_info_from_ai(cached)
+            else:
+                pending.append(name)
+
+        for start in range(0, len(pending), self._ai_batch_max):
+            batch = pending[start:start + self._ai_batch_max]
+            name_list = "\n                ".join(f"{index}. {name}" for index, name in enumerate(batch))
+
+            try:
+                # 准备提示
+                prompt = f"""
+                从以下编号的文件名中分别提取媒体信息：
+                {name_list}
+
+                每个文件名需要提取以下信息：
+                1. 媒体类型（电影/电视剧）
+                2. 标题（中文或原始语言）
+                3. 年份
+                4. 季数（如果是电视剧）
+                5. 集数（如果是电视剧）
+                6. 分辨率（如1080p、4K等，如果有）
+
+                请返回JSON数组，每个文件名对应一个元素：
+                [
+                  {{
+                    "index": 编号,
+                    "type": "movie或tv",
+                    "title": "标题",
+                    "year": "年份",
+                    "season": 季数(仅电视剧),
+                    "episode": 集数(仅电视剧),
+                    "resolution": "分辨率"
+                  }}
+                ]
+
+                只返回JSON，不要解释。
+                """
+
+                # 发送请求
+                response = self._ai_client.chat.completions.create(
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": "你是一个专业的媒体文件分析工具，专门从文件名中提取媒体信息。",
+                        },
+                        {
+                            "role": "user",
+                            "content": prompt,
+                        }
+                    ],
+                    model=self.config.ai_model
+                )
+
+                # 处理响应
+                if not response or not response.choices:
+                    continue
+
+                message = response.choices[0].message
+                if not message or not message.content:
+                    continue
+
+                content = _JSON_FENCE_RE.sub('', message.content.strip())
+                ai_items = _json_loads(content)
+                if not isinstance(ai_items, list):
+                    self.logger.error(f"AI批量返回的不是JSON数组: {content}")
+                    continue
+
+                # 按编号对应回文件名
+                entries = {}
+                for ai_info in ai_items:
+                    if not isinstance(ai_info, dict):
+                        continue
+                    index = ai_info.pop('index', None)
+                    if not isinstance(index, int) or not 0 <= index < len(batch):
+                        continue
+                    name = batch[index]
+                    results[name] = self._media_info_from_ai(ai_info)
+                    entries[self._ai_cache_key('info', name)] = ai_info
+
+                self.logger.info(f"AI批量提取媒体信息: {len(entries)}/{len(batch)} 个")
+                self._ai_cache_update(entries)
+            except json.JSONDecodeError:
+                self.logger.error(f"无法解析AI批量返回的JSON: {content}")
+            except Exception as e:
+                self.logger.error(f"AI批量提取媒体信息失败: {e}")
+
+        return results
+
+    @staticmethod
+    def _media_info_from_ai(ai_info: Dict[str, Any]) -> MediaInfo:
+        """将AI返回的字典转换为MediaInfo对象"""
+        return MediaInfo(
+            title=ai_info.get('title', ''),
+            year=str(ai_info.get('year', '未知')),
+            type=ai_info.get('type', 'unknown'),
+            season=ai_info.get('season'),
+            episode=ai_info.get('episode'),
+            resolution=ai_info.get('resolution')
+        )
+
     def rename_directory(self, directory_path: str, media_info: MediaInfo) -> str:
-        """重命名目录"""
-        dir_name = os.path.basename(directory_path)
+        """重命名目录，多次尝试仍失败时抛出RetryLaterError"""
+        parent_dir, dir_name = os.path.split(directory_path)
 
         # 尝试获取AI建议的目录名
         ai_dir_name = None
@@ -299,41 +696,35 @@ class MediaRenamer:
             new_dir_name = f"{media_info.title}（{media_info.year}）"
 
         # 获取完整路径
-        parent_dir = os.path.dirname(directory_path)
         new_path = os.path.join(parent_dir, new_dir_name)
 
         # 检查是否需要重命名
-        if directory_path == new_path or os.path.exists(new_path):
+        if directory_path == new_path:
             return directory_path
 
-        # 重命名目录
-        try:
-            # 添加延迟和重试
-            max_retries = 3
-            for retry in range(max_retries):
-                try:
-                    if not os.path.exists(directory_path):
-                        time.sleep(1)
-                        continue
-
-                    os.rename(directory_path, new_path)
-                    self.logger.info(f"已重命名目录: {os.path.basename(directory_path)} -> {new_dir_name}")
-                    return new_path
-                except Exception as e:
-                    if retry < max_retries - 1:
-                        time.sleep(1)
-                    else:
-                        raise
+        # 重命名目录，失败时短暂退避重试，仍失败则交由调用方稍后重试，避免长时间阻塞
+        last_error = None
+        for delay in (0.0,) + _RENAME_RETRY_DELAYS:
+            if last_error is not None:
+                time.sleep(delay)
+            try:
+                # 目录已不存在或目标已存在则不重命名
+                if not os.path.exists(directory_path) or not _rename_noreplace(directory_path, new_path):
+                    return directory_path
+                self.logger.info(f"已重命名目录: {dir_name} -> {new_dir_name}")
+                return new_path
+            except Exception as e:
+                last_error = e
 
-            return directory_path
-        except Exception as e:
-            self.logger.error(f"重命名目录出错: {e}")
-            return directory_path
+        self.logger.warning(f"重命名目录暂时失败: {last_error}")
+        raise RetryLaterError(directory_path) from last_error
 
-    def rename_file(self, file_path: str, media_info: MediaInfo) -> str:
-        """重命名文件"""
-        original_name = os.path.basename(file_path)
-        _, ext = os.path.splitext(file_path)
+    def rename_file(self, file_path: str, media_info: MediaInfo, directory: Optional[str] = None,
+                    original_name: Optional[str] = None) -> str:
+        """重命名文件，调用方已拆分出所在目录和文件名时可直接传入"""
+        if directory is None or original_name is None:
+            directory, original_name = os.path.split(file_path)
+        _, ext = os.path.splitext(original_name)
 
         # 尝试获取AI建议的文件名
         ai_filename = None
@@ -347,32 +738,22 @@ class MediaRenamer:
         if ai_filename:
             new_filename = ai_filename
         else:
-            # 标准命名格式
-            resolution_tag = f" - [{media_info.resolution}]" if media_info.resolution else ""
-
-            if media_info.is_movie:
-                new_filename = f"{media_info.title}（{media_info.year}）{resolution_tag}{ext}"
-            else:  # 电视剧
-                if media_info.episode:
-                    season_num = str(media_info.season or 1).zfill(2)
-                    episode_num = str(media_info.episode).zfill(2)
-                    new_filename = f"{media_info.title}（{media_info.year}） - S{season_num}E{episode_num}{resolution_tag}{ext}"
-                else:
-                    season_num = str(media_info.season or 1).zfill(2)
-                    new_filename = f"{media_info.title}（{media_info.year}） - Season {season_num}{resolution_tag}{ext}"
+            # 标准命名格式，非电影的类型都按电视剧命名
+            formatter = _FILENAME_FORMATTERS[(media_info.is_movie, bool(media_info.episode))]
+            new_filename = formatter(media_info, ext)
 
         # 获取完整路径
-        directory = os.path.dirname(file_path)
         new_path = os.path.join(directory, new_filename)
 
         # 检查是否需要重命名
-        if file_path == new_path or os.path.exists(new_path):
+        if file_path == new_path:
             return file_path
 
-        # 重命名文件
+        # 重命名文件，目标已存在则不重命名
         try:
-            os.rename(file_path, new_path)
-            self.logger.info(f"已重命名文件: {os.path.basename(file_path)} -> {new_filename}")
+            if not _rename_noreplace(file_path, new_path):
+                return file_path
+            self.logger.info(f"已重命名文件: {original_name} -> {new_filename}")
             return new_path
         except Exception as e:
             self.logger.error(f"重命名文件出错: {e}")
@@ -384,15 +765,12 @@ class MediaRenamer:
         if not self.config.ai_enabled:
             return None
 
-        try:
-            from openai import OpenAI
-
-            # 初始化OpenAI客户端
-            client = OpenAI(
-                base_url=self.config.ai_endpoint,
-                api_key=self.config.ai_api_key,
-            )
+        cache_key = self._ai_cache_key('name', original_name, astuple(media_info), is_directory)
+        cached = self._ai_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
+        try:
             # 准备提示
             if is_directory:
                 prompt = f"""
@@ -431,7 +809,7 @@ class MediaRenamer:
             # 发送请求
             max_retries = 2
             for retry in range(max_retries):
-                response = client.chat.completions.create(
+                response = self._ai_client.chat.completions.create(
                     messages=[
                         {
                             "role": "system",
@@ -451,7 +829,8 @@ class MediaRenamer:
                     if message and message.content:
                         # 提取内容并移除可能的Markdown代码块和引号
                         content = message.content.strip()
-                        content = re.sub(r'```.*\n|\n```|^[\s`"\']*|[\s`"\']*$', '', content)
+                        content = _SUGGESTION_CLEAN_RE.sub('', content)
+                        self._ai_cache_update({cache_key: content})
                         return content
 
                 # 重试前等待
@@ -1,8 +1,12 @@
+import heapq
 import os
+import signal
+import stat
 import sys
 import time
 import threading
-from typing import Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple, Union
 
 from watchdog.observers import Observer
 from watchdog.observers.polling import PollingObserver
@@ -10,7 +14,26 @@ from watchdog.events import FileSystemEventHandler, FileCreatedEvent
 
 from config import Config
 from logger import Logger
-from media_renamer import MediaRenamer
+from media_renamer import MediaRenamer, RetryLaterError
+
+# 事件入队后等待文件写入稳定的时间（秒）
+_SETTLE_DELAY = 2.0
+# 暂时失败的事件最多重新入队的次数
+_MAX_REQUEUES = 3
+
+
+class _StatEntry:
+    """由lstat结果构造的目录项，提供处理时用到的os.DirEntry接口子集"""
+    __slots__ = ('name', 'path', '_is_dir')
+
+    def __init__(self, parent: str, name: str, st: os.stat_result):
+        self.name = name
+        self.path = os.path.join(parent, name)
+        self._is_dir = stat.S_ISDIR(st.st_mode)
+
+    def is_dir(self, follow_symlinks: bool = True) -> bool:
+        """是否为目录（lstat结果不跟随符号链接）"""
+        return self._is_dir
 
 
 class MediaFileHandler(FileSystemEventHandler):
@@ -22,9 +45,14 @@ class MediaFileHandler(FileSystemEventHandler):
         self.logger = Logger(config).get_logger()
         self.media_renamer = MediaRenamer(config)
 
+        # 媒体扩展名集合，用于入队前过滤非媒体文件（validate后已是小写集合）
+        self._exts_set = frozenset(config.media_exts)
+
         # 使用事件队列延迟处理，避免处理不完整的文件
-        self.event_queue: Dict[str, Dict[str, Any]] = {}
-        self.queue_lock = threading.Lock()
+        # _pending保存每个路径的最新事件，_heap按到期时间排序
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self._cv = threading.Condition()
 
         # 添加此行：设置running属性
         self.running = True
@@ -36,57 +64,223 @@ class MediaFileHandler(FileSystemEventHandler):
 
     def on_created(self, event):
         """将创建事件加入队列"""
-        with self.queue_lock:
-            path = os.path.normpath(event.src_path)
-            self.event_queue[path] = {
-                'type': 'created',
-                'is_directory': event.is_directory,
-                'timestamp': time.time()
-            }
+        path = os.path.normpath(event.src_path)
+
+        # 非媒体文件直接丢弃，不占用队列和锁
+        if not event.is_directory and os.path.splitext(path)[1].lower() not in self._exts_set:
+            return
+
+        self._enqueue(path, {
+            'type': 'created',
+            'is_directory': event.is_directory,
+        })
+
+    def _enqueue(self, path: str, event_info: Dict[str, Any]) -> None:
+        """事件入队，等待_SETTLE_DELAY后处理"""
+        with self._cv:
+            event_info['timestamp'] = time.monotonic()
+            self._pending[path] = event_info
+            heapq.heappush(self._heap, (event_info['timestamp'] + _SETTLE_DELAY, path))
+            self._cv.notify()
+
+    def _requeue(self, path: str, event_info: Dict[str, Any]) -> None:
+        """暂时失败的事件重新入队，超过次数后放弃"""
+        retries = event_info.get('retries', 0) + 1
+        if retries > _MAX_REQUEUES:
+            self.logger.error(f"多次重试后仍无法处理，已放弃: {path}")
+            return
+
+        with self._cv:
+            # 期间已有新事件入队时以新事件为准
+            if path in self._pending:
+                return
+        self.logger.info(f"稍后重试: {path} (第{retries}次)")
+        self._enqueue(path, dict(event_info, retries=retries))
+
+    def _pop_ready(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """等待并取出所有已到期的事件，停止时返回空列表"""
+        with self._cv:
+            while self.running:
+                now = time.monotonic()
+                ready = []
+                while self._heap and self._heap[0][0] <= now:
+                    deadline, path = heapq.heappop(self._heap)
+                    event_info = self._pending.get(path)
+                    # 同一路径再次触发事件时，旧的堆条目已过期，直接丢弃
+                    if event_info is None or event_info['timestamp'] + _SETTLE_DELAY > deadline:
+                        continue
+                    del self._pending[path]
+                    ready.append((path, event_info))
+
+                if ready:
+                    return ready
+
+                # 空闲时一直等待，否则等到最近的到期时间
+                timeout = self._heap[0][0] - now if self._heap else None
+                self._cv.wait(timeout)
+        return []
 
     def _process_queue(self):
         """处理事件队列"""
         while self.running:
             try:
-                # 处理队列中的事件
-                with self.queue_lock:
-                    current_time = time.time()
-                    to_process = []
+                # 在锁外处理已到期的事件
+                to_process = self._pop_ready()
+
+                # 获取目录项，同一父目录下的多个事件只扫描一次目录
+                entries = self._scan_entries(path for path, _ in to_process)
+
+                # 同一目录下的多个新文件合并为一次AI请求
+                if self.config.ai_enabled:
+                    self._prefetch_ai_media_info(entries.values())
 
-                    # 找出等待时间超过2秒的事件
-                    for path, event_info in list(self.event_queue.items()):
-                        if current_time - event_info['timestamp'] >= 2.0:
-                            to_process.append((path, event_info))
-                            del self.event_queue[path]
+                # 先处理文件，再由深到浅处理目录，避免目录改名后同批次中子路径的目录项失效
+                ready = [(path, event_info) for path, event_info in to_process if path in entries]
+                ready.sort(key=lambda item: (entries[item[0]][1].is_dir(follow_symlinks=False),
+                                             -item[0].count(os.sep)))
 
                 # 处理已就绪的事件
-                for path, event_info in to_process:
-                    if not os.path.exists(path):
-                        continue
+                for path, event_info in ready:
+                    directory, entry = entries[path]
 
-                    if event_info['is_directory']:
-                        self.logger.info(f"处理新目录: {path}")
-                        self.media_renamer.process_directory(path)
-                    else:
-                        self.logger.info(f"处理新文件: {path}")
-                        directory = os.path.dirname(path)
-                        self.media_renamer.process_file(path, directory)
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            self.logger.info(f"处理新目录: {path}")
+                            self.media_renamer.process_directory(path, entry)
+                        else:
+                            self.logger.info(f"处理新文件: {path}")
+                            self.media_renamer.process_file(path, directory, entry)
+                    except RetryLaterError:
+                        # 不阻塞队列，稍后重新处理该事件
+                        self._requeue(path, event_info)
 
             except Exception as e:
                 self.logger.error(f"处理队列时出错: {e}")
 
-            # 每秒检查一次队列
-            time.sleep(1)
+    def _prefetch_ai_media_info(self, entries: Iterable[Tuple[str, Union[os.DirEntry, _StatEntry]]]) -> None:
+        """按父目录分组，对包含多个需要AI的媒体文件的目录批量请求AI，结果进入缓存供后续处理使用"""
+        groups: Dict[str, List[str]] = {}
+        for parent, entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                continue
+            if os.path.splitext(entry.name)[1].lower() not in self._exts_set:
+                continue
+            # 正则已能完整解析的文件不需要AI
+            local_info = self.media_renamer.extract_media_info_local(entry.name)
+            if local_info and local_info.is_complete:
+                continue
+            groups.setdefault(parent, []).append(entry.name)
+
+        for names in groups.values():
+            if len(names) > 1:
+                self.media_renamer.ai_extract_media_info_batch(names)
+
+    @staticmethod
+    def _scan_entries(paths: Iterable[str]) -> Dict[str, Tuple[str, Union[os.DirEntry, _StatEntry]]]:
+        """获取路径对应的（父目录, 目录项）映射（不存在的路径不在结果中）
+
+        同一父目录下有多个路径时scandir一次，只有一个路径时直接lstat，避免为单个事件列举整个目录
+        """
+        wanted: Dict[str, Set[str]] = {}
+        for path in paths:
+            parent, name = os.path.split(path)
+            wanted.setdefault(parent, set()).add(name)
+
+        entries: Dict[str, Tuple[str, Union[os.DirEntry, _StatEntry]]] = {}
+        for parent, names in wanted.items():
+            try:
+                if len(names) == 1:
+                    name = next(iter(names))
+                    path = os.path.join(parent, name)
+                    entries[path] = (parent, _StatEntry(parent, name, os.lstat(path)))
+                    continue
+
+                with os.scandir(parent) as it:
+                    for entry in it:
+                        if entry.name in names:
+                            entries[os.path.join(parent, entry.name)] = (parent, entry)
+            except OSError:
+                continue
+        return entries
 
     def stop(self):
         """停止队列处理器"""
-        self.running = False
+        with self._cv:
+            self.running = False
+            self._cv.notify_all()
 
         # 等待队列处理完毕
         if self.queue_processor.is_alive():
             self.queue_processor.join(timeout=5)
 
 
+def scan_existing(media_renamer: MediaRenamer, config: Config) -> None:
+    """启动时并行处理监控目录中已有的文件和目录"""
+    logger = Logger().get_logger()
+
+    # 非递归遍历目录树，记录文件和各层目录
+    files: List[Tuple[str, os.DirEntry]] = []
+    dirs_by_depth: Dict[int, List[os.DirEntry]] = {}
+    stack = [(config.monitor_path, 0)]
+    while stack:
+        path, depth = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs_by_depth.setdefault(depth, []).append(entry)
+                        if config.recursive:
+                            stack.append((entry.path, depth + 1))
+                    elif entry.is_file(follow_symlinks=False):
+                        files.append((path, entry))
+        except OSError as e:
+            logger.error(f"扫描目录出错: {path}: {e}")
+
+    logger.info(f"初始扫描: {len(files)} 个文件, {sum(map(len, dirs_by_depth.values()))} 个目录")
+
+    # 重命名主要在等待系统调用，线程数可以多于CPU核数
+    max_workers = min(32, (os.cpu_count() or 1) * 4)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    # 当前批次已提交的任务，中断时用于取消
+    futures = []
+
+    def run_batch(func, args_list) -> None:
+        """并行执行一批任务并等待全部完成"""
+        futures[:] = [executor.submit(func, *args) for args in args_list]
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"初始扫描处理出错: {e}")
+
+    try:
+        # 先处理文件，再由深到浅逐层处理目录，避免目录改名后子路径失效
+        run_batch(media_renamer.process_file,
+                  [(entry.path, parent, entry) for parent, entry in files])
+        for depth in sorted(dirs_by_depth, reverse=True):
+            run_batch(media_renamer.process_directory,
+                      [(entry.path, entry) for entry in dirs_by_depth[depth]])
+    except KeyboardInterrupt:
+        # 取消尚未开始的任务，正在执行的AI请求最多等到请求超时
+        if sys.version_info >= (3, 9):
+            executor.shutdown(wait=False, cancel_futures=True)
+        else:
+            # Python 3.8的shutdown没有cancel_futures参数
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+        raise
+    executor.shutdown()
+
+    logger.info("初始扫描完成")
+
+
+def _raise_keyboard_interrupt(signum, frame):
+    """将SIGTERM转换为KeyboardInterrupt，使systemctl stop与Ctrl+C走同一关闭流程"""
+    raise KeyboardInterrupt
+
+
 def start_monitoring(config_path: str = 'config.json'):
     """开始监控目录"""
     # 加载配置
@@ -97,8 +291,8 @@ def start_monitoring(config_path: str = 'config.json'):
         print(f"配置错误: {e}")
         sys.exit(1)
 
-    # 获取日志
-    logger = Logger(config).get_logger()
+    # 获取日志，每次启动使用新的日志文件
+    logger = Logger(config, truncate=True).get_logger()
     logger.info("启动媒体文件监控服务")
 
     # 创建处理器
@@ -131,13 +325,22 @@ def start_monitoring(config_path: str = 'config.json'):
     logger.info(f"开始监控目录: {config.monitor_path} (递归: {config.recursive})")
     logger.info("按 Ctrl+C 停止监控")
 
+    # 作为服务运行时通过SIGTERM停止，默认处理会跳过退出清理，导致缓冲的日志丢失
+    signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+
     try:
+        # 处理启动前已存在的媒体文件
+        if config.initial_scan:
+            scan_existing(event_handler.media_renamer, config)
+
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
         logger.info("接收到停止信号，正在关闭...")
         event_handler.stop()
         observer.stop()
+        # 立即写入尚未保存的AI结果，不依赖延迟写入的定时器
+        event_handler.media_renamer.save_ai_cache()
 
     observer.join()
     logger.info("监控服务已停止")